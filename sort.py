@@ -1,7 +1,13 @@
+import mmap
 import os
 import shutil
-import fitparse
-import gpxpy
+import struct
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
 
 # Define source and destination directories
 source_dir = "activities"
@@ -9,47 +15,159 @@ cycling_dir = source_dir + "/cycling"
 running_dir = source_dir + "/running"
 walking_dir = source_dir + "/walking"
 
-# Ensure destination directories exist
-for folder in [cycling_dir, running_dir, walking_dir]:
-    os.makedirs(folder, exist_ok=True)
+# Parsers issue many small reads; a large buffer turns them into a handful of
+# read() syscalls per file instead of one per 8 KiB.
+READ_BUFFER_SIZE = 256 * 1024
+
+# FIT global message number -> field number of its sport enum (sport, session)
+FIT_SPORT_FIELDS = {12: 0, 18: 5}
+# FIT profile sport enum, named as fitparse reports them
+FIT_SPORTS = {
+    0: "generic", 1: "running", 2: "cycling", 3: "transition", 4: "fitness_equipment",
+    5: "swimming", 6: "basketball", 7: "soccer", 8: "tennis", 9: "american_football",
+    10: "training", 11: "walking", 12: "cross_country_skiing", 13: "alpine_skiing",
+    14: "snowboarding", 15: "rowing", 16: "mountaineering", 17: "hiking", 18: "multisport",
+    19: "paddling", 20: "flying", 21: "e_biking", 22: "motorcycling", 23: "boating",
+    24: "driving", 25: "golf", 26: "hang_gliding", 27: "horseback_riding", 28: "hunting",
+    29: "fishing", 30: "inline_skating", 31: "rock_climbing", 32: "sailing",
+    33: "ice_skating", 34: "sky_diving", 35: "snowshoeing", 36: "snowmobiling",
+    37: "stand_up_paddleboarding", 38: "surfing", 39: "wakeboarding", 40: "water_skiing",
+    41: "kayaking", 42: "rafting", 43: "windsurfing", 44: "kitesurfing", 45: "tactical",
+    46: "jumpmaster", 47: "boxing", 48: "floor_climbing", 254: "all",
+}
+
+def normalize_sport(sport):
+    """Map a raw sport value onto the activity folders used here."""
+    sport = sport.lower()
+    if sport == "ebikeride":
+        return "cycling"
+    return sport
+
+def scan_fit_sport(data):
+    """Return the sport enum of the first sport/session message, or None.
+
+    Walks the FIT records with struct, interpreting only definition messages
+    and the single sport byte; every other data message is skipped by size.
+    Raises ValueError (or IndexError/struct.error on truncated data) for
+    anything it cannot follow, so callers can fall back to fitparse.
+    """
+    header_size = data[0]
+    if header_size < 12 or data[8:12] != b".FIT":
+        raise ValueError("not a FIT file")
+    (data_size,) = struct.unpack_from("<I", data, 4)
+    end = header_size + data_size
+    if end > len(data):
+        raise ValueError("truncated FIT file")
+
+    definitions = {}  # local message type -> (data size, sport byte offset or None)
+    pos = header_size
+    while pos < end:
+        header = data[pos]
+        pos += 1
+        if header & 0x80:
+            # Compressed timestamp header: data message, local type in bits 5-6
+            local_type = (header >> 5) & 0x03
+        elif header & 0x40:
+            # Definition message
+            endian = ">" if data[pos + 1] else "<"
+            (global_num,) = struct.unpack_from(endian + "H", data, pos + 2)
+            num_fields = data[pos + 4]
+            pos += 5
+            sport_field = FIT_SPORT_FIELDS.get(global_num)
+            size = 0
+            sport_offset = None
+            for _ in range(num_fields):
+                if data[pos] == sport_field:
+                    sport_offset = size
+                size += data[pos + 1]
+                pos += 3
+            if header & 0x20:
+                # Developer fields only add to the data size
+                num_dev_fields = data[pos]
+                pos += 1
+                for _ in range(num_dev_fields):
+                    size += data[pos + 1]
+                    pos += 3
+            definitions[header & 0x0F] = (size, sport_offset)
+            continue
+        else:
+            local_type = header & 0x0F
+
+        if local_type not in definitions:
+            raise ValueError(f"data message for undefined local type {local_type}")
+        size, sport_offset = definitions[local_type]
+        if sport_offset is not None:
+            sport = data[pos + sport_offset]
+            if sport != 0xFF:  # 0xFF is the enum "invalid" value
+                return sport
+        pos += size
+    return None
 
 def determine_activity_type_fit(file_path):
     """Determine activity type from .fit file."""
-    fitfile = fitparse.FitFile(file_path)
-    # First check for sport messages
-    for record in fitfile.get_messages("sport"):
-        sport = record.get_value("sport")
-        if sport:
-            sport = sport.lower()
-            if sport == "ebikeride":
-                return "cycling"
-            return sport
-
-    # If not found, also check in session messages
-    for record in fitfile.get_messages("session"):
-        sport = record.get_value("sport")
-        if sport:
-            sport = sport.lower()
-            if sport == "ebikeride":
-                return "cycling"
-            return sport
+    try:
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            sport = scan_fit_sport(data)
+    except (ValueError, IndexError, struct.error):
+        pass  # not something the fast scan understands; fall back to fitparse
+    else:
+        if sport is None:
+            return "unknown"
+        return normalize_sport(FIT_SPORTS.get(sport, str(sport)))
+
+    # Only needed for files the fast scan can't follow, so import on demand
+    import fitparse
+
+    # Sport/session messages carry the sport; stop decoding at the first one
+    # instead of walking every record message in the file.
+    with open(file_path, "rb", buffering=READ_BUFFER_SIZE) as f:
+        fitfile = fitparse.FitFile(f, check_crc=False)
+        for record in fitfile.get_messages(name=("sport", "session")):
+            sport = record.get_value("sport")
+            if sport:
+                return normalize_sport(sport)
 
     return "unknown"
 
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def scan_gpx_track_type(file_path):
+    """Return the first <trk><type> text, or None, without building the full GPX tree."""
+    path = []
+    with open(file_path, "rb", buffering=READ_BUFFER_SIZE) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                path.append(_local_name(elem.tag))
+                continue
+            if path[-1] == "type" and len(path) >= 2 and path[-2] == "trk" and elem.text:
+                return elem.text.strip()
+            path.pop()
+            # Drop finished trackpoints so memory stays flat on long rides
+            if path and path[-1] == "trkseg":
+                elem.clear()
+    return None
+
 def determine_activity_type_gpx(file_path):
     """Determine activity type from .gpx file."""
-    with open(file_path, "r") as gpx_file:
-        gpx = gpxpy.parse(gpx_file)
-        if gpx.tracks:
+    try:
+        sport = scan_gpx_track_type(file_path)
+    except ET.ParseError:
+        # Let gpxpy have a go at files the streaming scan rejects
+        import gpxpy
+
+        sport = None
+        with open(file_path, "r") as gpx_file:
+            gpx = gpxpy.parse(gpx_file)
             for track in gpx.tracks:
                 if track.type:
-                    sport = track.type.lower()
-                    if sport == "ebikeride":
-                        return "cycling"
-                    return sport
+                    sport = track.type
+                    break
+    if sport:
+        return normalize_sport(sport)
     return "unknown"
 
-def move_file(file_path, activity_type):
+def move_file(file_path, file_name, activity_type):
     """Move file based on activity type."""
     if activity_type == "cycling":
         dest_folder = cycling_dir
@@ -60,24 +178,55 @@ def move_file(file_path, activity_type):
     else:
         print(f"Unknown activity type for {file_path}, skipping...")
         return
-    
-    shutil.move(file_path, os.path.join(dest_folder, os.path.basename(file_path)))
+
+    dst_path = os.path.join(dest_folder, file_name)
+    try:
+        # Destinations live under source_dir, so a plain rename normally works
+        os.rename(file_path, dst_path)
+    except OSError:
+        shutil.move(file_path, dst_path)
     print(f"Moved {file_path} to {dest_folder}")
 
-# Process files
-for file_name in os.listdir(source_dir):
-    file_path = os.path.join(source_dir, file_name)
-    if os.path.isfile(file_path):
-        activity_type = "unknown"
-        try:
-            if file_name.endswith(".fit"):
-                activity_type = determine_activity_type_fit(file_path)
-            elif file_name.endswith(".gpx"):
-                activity_type = determine_activity_type_gpx(file_path)
-            
-            if activity_type in ["cycling", "running", "walking"]:
-                move_file(file_path, activity_type)
-            else:
-                print(f"Uncategorised activity type {activity_type} for {file_name}, skipping...")
-        except Exception as e:
-            print(f"Error processing {file_name}: {e}")
+def classify(file_path):
+    """Determine activity type for a file; runs in a worker process.
+
+    Errors are returned as text rather than raised: some parser exceptions
+    cannot be unpickled in the parent and would break the whole pool.
+    """
+    activity_type = "unknown"
+    try:
+        if file_path.endswith(".fit"):
+            activity_type = determine_activity_type_fit(file_path)
+        elif file_path.endswith(".gpx"):
+            activity_type = determine_activity_type_gpx(file_path)
+    except Exception as e:
+        return file_path, activity_type, str(e)
+    return file_path, activity_type, None
+
+if __name__ == "__main__":
+    # Ensure destination directories exist
+    for folder in [cycling_dir, running_dir, walking_dir]:
+        os.makedirs(folder, exist_ok=True)
+
+    # Parse files in parallel; moves stay on the main process so filesystem
+    # mutations are serialized.
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        futures = {}
+        # scandir entries carry the file type, so is_file() needs no extra stat
+        with os.scandir(source_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    futures[ex.submit(classify, entry.path)] = entry.name
+
+        for future in as_completed(futures):
+            file_name = futures[future]
+            try:
+                file_path, activity_type, error = future.result()
+                if error:
+                    print(f"Error processing {file_name}: {error}")
+                elif activity_type in ["cycling", "running", "walking"]:
+                    move_file(file_path, file_name, activity_type)
+                else:
+                    print(f"Uncategorised activity type {activity_type} for {file_name}, skipping...")
+            except Exception as e:
+                print(f"Error processing {file_name}: {e}")
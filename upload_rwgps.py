@@ -4,9 +4,12 @@
 Features:
   * Authenticates with RideWithGPS (email/password -> auth_token) using API key
   * Parses `activities.csv` for Activity ID, Name, Description, Media
+    (ride activity types only by default; cached in `.activities_cache.pkl`
+    until the CSV changes)
   * Uploads each FIT/GPX(/gz) file found under `activities/cycling`
   * Sets trip name & description from CSV
   * Skips already uploaded activities (tracked in `.uploaded_rwgps.log`)
+  * Uploads several activities (and each trip's photos) concurrently
   * Dry-run mode to preview actions
   * Graceful error handling & progress summary
 
@@ -24,35 +27,66 @@ Environment variables (can be placed in a `.env` file):
     RWGPS_PHOTO_VERSION (default 3 for /photos.json endpoint)
   RWGPS_BASE_URL (default https://ridewithgps.com)
   RWGPS_DRY_RUN (true/false)
+  RWGPS_CONCURRENCY (default 4 parallel uploads, each up to 2 photos at a time)
 
 Usage examples:
   python upload_rwgps.py               # normal run
   python upload_rwgps.py --dry-run     # no network mutations
   python upload_rwgps.py --only 123,456
+  python upload_rwgps.py --concurrency 8
+  python upload_rwgps.py --activity-type "Ride,Gravel Ride"   # or "all"
 
 """
 
 from __future__ import annotations
 
 import argparse
-import csv
 import gzip
+import mmap
 import os
+import pickle
+import re
+import shutil
 import sys
+import tempfile
+import threading
 import time
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Iterable
+from typing import Dict, List, NamedTuple, Optional, Iterable, Set
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-import mimetypes
+
+
+# Photo MIME types by extension; avoids loading the system mimetypes database.
+_MIME = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.heic': 'image/heic',
+    '.heif': 'image/heif',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+
+
+_print_lock = threading.Lock()
+
+
+def log(message: str):
+    """print() one whole line at a time; uploads report from several threads."""
+    with _print_lock:
+        print(message, flush=True)
 
 
 # Helper must be defined before it's used inside RWGPSClient methods when script executes main immediately.
 def _guess_mime(path: Path) -> str:
-    mime, _ = mimetypes.guess_type(str(path))
-    return mime or 'application/octet-stream'
+    return _MIME.get(path.suffix.lower(), 'application/octet-stream')
 
 
 # ---------- Configuration ----------
@@ -60,23 +94,239 @@ PROJECT_ROOT = Path(__file__).parent
 CSV_PATH = PROJECT_ROOT / "activities.csv"
 CYCLING_DIR = PROJECT_ROOT / "activities" / "cycling"
 UPLOADED_LOG = PROJECT_ROOT / ".uploaded_rwgps.log"
+METADATA_CACHE = PROJECT_ROOT / ".activities_cache.pkl"
+METADATA_CACHE_VERSION = 4  # bump whenever the cached index's structure changes
+# activities.csv columns read for trip metadata, in the order parse_activity_csv unpacks them
+CSV_COLUMNS = ('Activity ID', 'Activity Name', 'Activity Description', 'Media', 'Filename')
+# Strava 'Activity Type' values loaded by default: Strava's ride types. sort.py
+# sorts by the sport recorded in the file, so a few cycling files may not match.
+ACTIVITY_TYPE_COLUMN = 'Activity Type'
+DEFAULT_ACTIVITY_TYPES = ('Ride', 'E-Bike Ride', 'Virtual Ride', 'Gravel Ride', 'Mountain Bike Ride',
+                          'E-Mountain Bike Ride', 'Velomobile', 'Handcycle')
+# Activity file extension, optionally gzipped (.fit, .gpx.gz, ...), stripped to get the file-based ID
+_EXT_RE = re.compile(r'\.(?:fit|gpx|tcx)(?:\.gz)?$', re.IGNORECASE)
 
 # Sentinel values for special outcomes
 DUPLICATE_TRIP = -2  # queued task indicated duplicate; treat as skipped
 
+# Queued task polling starts quickly and backs off towards the poll interval
+POLL_INITIAL_DELAY = 0.25
+POLL_BACKOFF = 1.5
 
-@dataclass
-class ActivityMeta:
+# Photos uploaded at once for each trip; multiplies with --concurrency
+PHOTO_CONCURRENCY = 2
+
+
+class ActivityMeta(NamedTuple):
+    # A tuple per CSV row: no per-instance __dict__ for large exports
     activity_id: str
     name: str
     description: str
     media_paths: List[Path]
 
 
+@dataclass
+class ActivityIndex:
+    """CSV metadata keyed by Activity ID, plus filename-stem aliases.
+
+    Aliases map a filename-derived ID to its Activity ID rather than holding a
+    second reference, and are only stored when the two differ. `filtered`
+    holds the IDs (both forms) of rows skipped by the activity type filter.
+    """
+    by_id: Dict[str, ActivityMeta] = field(default_factory=dict)
+    aliases: Dict[str, str] = field(default_factory=dict)
+    filtered: Set[str] = field(default_factory=set)
+
+    def get(self, key: str) -> Optional[ActivityMeta]:
+        meta = self.by_id.get(key)
+        if meta is None and key in self.aliases:
+            meta = self.by_id.get(self.aliases[key])
+        return meta
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+
+@dataclass
+class _PendingTask:
+    future: Future
+    label: str
+    deadline: float
+    interval: float
+    last_status: Optional[str] = None
+
+
+_TASK_RUNNING = object()  # queued task has no final outcome yet
+
+
+class TaskPoller:
+    """Poll queued_tasks/status.json for every in-flight upload at once.
+
+    Upload threads register their task ID and block on a Future. A single
+    background thread requests the status of all pending IDs per round
+    (ids=101,102,...) and resolves each Future with the trip ID,
+    DUPLICATE_TRIP or None. Replies are matched by their task id; if that
+    fails the poller falls back to one request per task. Most tasks finish
+    within a second, so the wait between rounds starts at POLL_INITIAL_DELAY
+    (again whenever a task is added) and grows by POLL_BACKOFF up to the poll
+    interval; errors always wait the full interval. The thread exits once
+    nothing is pending.
+    """
+
+    def __init__(self, client: "RWGPSClient"):
+        self.client = client
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _PendingTask] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._delay = POLL_INITIAL_DELAY
+        self._poll_count = 0
+        # Set once a batched reply can't be matched back by task id; from then
+        # on each task is polled on its own, as a lone reply is unambiguous.
+        self._poll_singly = False
+
+    def wait_for_trip(self, task_id: int, interval: float, timeout: float, label: str) -> Optional[int]:
+        task = _PendingTask(Future(), label, time.time() + timeout, interval)
+        with self._lock:
+            self._pending[str(task_id)] = task
+            self._delay = min(POLL_INITIAL_DELAY, interval)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rwgps-task-poller", daemon=True)
+                self._thread.start()
+        return task.future.result()
+
+    def _run(self):
+        try:
+            self._loop()
+        except Exception as e:
+            # Never leave upload threads blocked on futures nobody will resolve
+            with self._lock:
+                pending = list(self._pending.values())
+                self._pending.clear()
+                self._thread = None
+            for task in pending:
+                task.future.set_exception(e)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                for task_id, task in list(self._pending.items()):
+                    if now >= task.deadline:
+                        del self._pending[task_id]
+                        log(f"Timed out waiting for task {task_id} (last status={task.last_status})")
+                        task.future.set_result(None)
+                if not self._pending:
+                    self._thread = None
+                    return
+                if self._poll_singly:
+                    batches = list(self._pending)
+                else:
+                    batches = [','.join(self._pending)]
+                interval = min(task.interval for task in self._pending.values())
+            if all([self._poll(ids) for ids in batches]):
+                with self._lock:
+                    delay = self._delay
+                    self._delay = min(delay * POLL_BACKOFF, interval)
+            else:
+                delay = interval
+            time.sleep(delay)
+
+    def _poll(self, ids: str) -> bool:
+        """Issue one status request for `ids`; returns False on request/response errors."""
+        client = self.client
+        status_url = f"{client.base_url}/queued_tasks/status.json"
+        params = {
+            "ids": ids,
+            "include_objects": "true",
+            "apikey": client.api_key,
+            "auth_token": client.auth_token,
+            "version": client.version,
+        }
+        self._poll_count += 1
+        poll_count = self._poll_count
+        if client.poll_debug:
+            # Mask token for display
+            token_masked = None
+            if client.auth_token:
+                token_masked = client.auth_token[:6] + "..." + client.auth_token[-4:]
+            log(f"[POLL {poll_count}] GET {status_url} params={{ids:{ids}, include_objects:true, apikey:***, auth_token:{token_masked}, version:{client.version}}}")
+        try:
+            r = client.session.get(status_url, params=params, timeout=30)
+        except Exception as e:
+            log(f"Polling error tasks {ids}: {e}")
+            return False
+        if r.status_code != 200:
+            log(f"Polling non-200 for tasks {ids}: {r.status_code} {r.text[:180]}")
+            return False
+        if client.poll_debug:
+            snippet = r.text[:250].replace('\n', ' ')
+            log(f"[POLL {poll_count}] status={r.status_code} body_snippet={snippet}")
+        try:
+            data = r.json()
+        except Exception:
+            log(f"Polling JSON parse error tasks {ids}: {r.text[:180]}")
+            return False
+        qtasks = data.get('queued_tasks') or []
+        if not qtasks and client.poll_debug:
+            log(f"[POLL {poll_count}] No queued_tasks array yet")
+        single = ',' not in ids
+        unmatched = 0
+        for qtask in qtasks:
+            task_id = str(qtask.get('id'))
+            with self._lock:
+                pending = self._pending.get(task_id)
+                if pending is None and single and len(qtasks) == 1:
+                    # Reply without a usable id: it can only be the one task asked about
+                    task_id = ids
+                    pending = self._pending.get(task_id)
+            if pending is None:
+                unmatched += 1
+                continue
+            pending.last_status = qtask.get('status')
+            if client.poll_debug:
+                log(f"[POLL {poll_count}] task={task_id} task_status={pending.last_status} response_code={qtask.get('response_code')} message={qtask.get('message')} progress={qtask.get('progress')}")
+            result = self._task_result(task_id, qtask, pending.label)
+            if result is not _TASK_RUNNING:
+                with self._lock:
+                    self._pending.pop(task_id, None)
+                pending.future.set_result(result)
+        if unmatched and not single and not self._poll_singly:
+            log(f"Could not match {unmatched} queued task entries to tasks {ids} by id; "
+                f"polling tasks one at a time from now on")
+            self._poll_singly = True
+        elif unmatched and client.poll_debug:
+            log(f"[POLL {poll_count}] {unmatched} queued task entries did not match tasks {ids}")
+        return True
+
+    @staticmethod
+    def _task_result(task_id: str, task: dict, label: str):
+        """Map one queued task status to trip ID / DUPLICATE_TRIP / None, or _TASK_RUNNING."""
+        response_code = task.get('response_code')
+        if response_code == 'success':
+            # find trip object
+            for obj in task.get('associated_objects', []):
+                if obj.get('type') == 'trip':
+                    trip = obj.get('trip') or {}
+                    trip_id = trip.get('id')
+                    if trip_id:
+                        log(f"Task {task_id} complete -> trip_id={trip_id} ({label})")
+                        return trip_id
+            log(f"Task {task_id} success but no trip found yet; continuing...")
+        elif response_code == 'duplicate':
+            log(f"Task {task_id} marked duplicate; skipping upload for {label}.")
+            return DUPLICATE_TRIP
+        elif response_code in ('error', 'failed'):
+            log(f"Task {task_id} failed: {task.get('message')}")
+            return None
+        # Still processing
+        return _TASK_RUNNING
+
+
 class RWGPSClient:
     def __init__(self, api_key: str, base_url: str, version: str = "2", auth_token: Optional[str] = None,
                  email: Optional[str] = None, password: Optional[str] = None, dry_run: bool = False,
-                 photo_version: str = "3", poll_debug: bool = False):
+                 photo_version: str = "3", poll_debug: bool = False, max_workers: int = 4,
+                 photo_workers: int = PHOTO_CONCURRENCY):
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
         self.version = version
@@ -86,11 +336,29 @@ class RWGPSClient:
         self.password = password
         self.dry_run = dry_run
         self.poll_debug = poll_debug
+        self.max_workers = max(1, max_workers)  # activities uploaded in parallel
+        self.photo_workers = max(1, photo_workers)  # concurrent photo uploads per trip
+        self._auth_lock = threading.Lock()
+        # One keep-alive pool shared by every request and worker thread (trip
+        # workers x photo workers, plus the task poller). Retry only applies to GETs
+        # on transient 5xx; POSTs are never replayed so uploads can't duplicate.
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504], raise_on_status=False)
+        adapter = HTTPAdapter(pool_maxsize=self.max_workers * self.photo_workers + 1, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.task_poller = TaskPoller(self)
 
     # ---- Authentication ----
     def ensure_auth(self):
         if self.auth_token:
             return
+        # Uploads run on worker threads; only the first one should log in.
+        with self._auth_lock:
+            if not self.auth_token:
+                self._authenticate()
+
+    def _authenticate(self):
         if not (self.email and self.password):
             raise RuntimeError("Email/password required to obtain auth_token.")
         url = f"{self.base_url}/users/current.json"
@@ -101,10 +369,10 @@ class RWGPSClient:
             "version": self.version,
         }
         if self.dry_run:
-            print(f"[DRY-RUN] Would authenticate: GET {url} (email={self.email})")
+            log(f"[DRY-RUN] Would authenticate: GET {url} (email={self.email})")
             self.auth_token = "DUMMY_TOKEN"
             return
-        r = requests.get(url, params=params, timeout=60)
+        r = self.session.get(url, params=params, timeout=60)
         if r.status_code != 200:
             raise RuntimeError(f"Auth failed {r.status_code}: {r.text[:500]}")
         data = r.json()
@@ -134,122 +402,53 @@ class RWGPSClient:
             "trip[name]": name,
             "trip[description]": description,
         }
-        # Support gz if needed (server likely handles) else decompress and send plain file.
-        send_path = file_path
-        temp_bytes = None
-        if file_path.suffix == '.gz':
-            with gzip.open(file_path, 'rb') as f:
-                temp_bytes = f.read()
-            files = {"file": (file_path.stem, temp_bytes)}
-        else:
-            files = {"file": (file_path.name, open(file_path, 'rb'))}
-
         if self.dry_run:
-            print(f"[DRY-RUN] Would POST {url} name='{name}' description len={len(description)} file={file_path.name}")
+            log(f"[DRY-RUN] Would POST {url} name='{name}' description len={len(description)} file={file_path.name}")
             return -1
+        # Support gz if needed. The streaming encoder needs a sized file, which
+        # a GzipFile is not, so decompress in chunks to a temporary file.
+        if file_path.suffix == '.gz':
+            fh = tempfile.TemporaryFile()
+            upload_name = file_path.stem
+        else:
+            fh = open(file_path, 'rb')
+            upload_name = file_path.name
         try:
-            r = requests.post(url, params=params, data=data, files=files, timeout=300)
+            if file_path.suffix == '.gz':
+                with gzip.open(file_path, 'rb') as gz:
+                    shutil.copyfileobj(gz, fh)
+                fh.seek(0)
+            # Stream the multipart body from disk as the socket sends it
+            encoder = MultipartEncoder(fields={**data, "file": (upload_name, fh)})
+            r = self.session.post(url, params=params, data=encoder,
+                                  headers={"Content-Type": encoder.content_type}, timeout=300)
         finally:
-            # Close file handle if not bytes
-            fh = files["file"][1]
             try:
-                close_meth = getattr(fh, 'close', None)
-                if callable(close_meth):
-                    close_meth()
+                fh.close()
             except Exception:
                 pass
         if r.status_code not in (200, 201, 202):
-            print(f"Upload failed for {file_path.name}: {r.status_code} {r.text[:300]}")
+            log(f"Upload failed for {file_path.name}: {r.status_code} {r.text[:300]}")
             return None
         try:
             resp = r.json()
         except Exception:
-            print(f"Unexpected non-JSON response for {file_path.name}: {r.text[:300]}")
+            log(f"Unexpected non-JSON response for {file_path.name}: {r.text[:300]}")
             return None
 
         task_id = resp.get('task_id') if isinstance(resp, dict) else None
         if task_id and poll:
-            print(f"Upload queued for {file_path.name}, task_id={task_id}; polling for trip id...")
+            log(f"Upload queued for {file_path.name}, task_id={task_id}; polling for trip id...")
             return self.poll_task_for_trip(task_id, poll_interval, poll_timeout, file_path.name)
-        print(f"No task id returned for {file_path.name}. Response keys: {list(resp.keys()) if isinstance(resp, dict) else 'unknown'}")
+        log(f"No task id returned for {file_path.name}. Response keys: {list(resp.keys()) if isinstance(resp, dict) else 'unknown'}")
         return None
 
     def poll_task_for_trip(self, task_id: int, interval: float, timeout: float, label: str) -> Optional[int]:
-        """Poll queued_tasks/status.json for a resulting trip ID."""
-        deadline = time.time() + timeout
-        status_url = f"{self.base_url}/queued_tasks/status.json"
-        params_base = {
-            "ids": str(task_id),
-            "include_objects": "true",
-            "apikey": self.api_key,
-            "auth_token": self.auth_token,
-            "version": self.version,
-        }
-        last_status = None
-        poll_count = 0
-        while time.time() < deadline:
-            if self.dry_run:
-                print(f"[DRY-RUN] Would poll {status_url}?ids={task_id}")
-                return -1
-            poll_count += 1
-            if self.poll_debug:
-                # Mask token for display
-                token_masked = None
-                if self.auth_token:
-                    token_masked = self.auth_token[:6] + "..." + self.auth_token[-4:]
-                print(f"[POLL {poll_count}] GET {status_url} params={{ids:{task_id}, include_objects:true, apikey:***, auth_token:{token_masked}, version:{self.version}}}")
-            try:
-                r = requests.get(status_url, params=params_base, timeout=30)
-            except Exception as e:
-                print(f"Polling error task {task_id}: {e}")
-                time.sleep(interval)
-                continue
-            if r.status_code != 200:
-                print(f"Polling non-200 for task {task_id}: {r.status_code} {r.text[:180]}")
-                time.sleep(interval)
-                continue
-            if self.poll_debug:
-                snippet = r.text[:250].replace('\n', ' ')
-                print(f"[POLL {poll_count}] status={r.status_code} body_snippet={snippet}")
-            try:
-                data = r.json()
-            except Exception:
-                print(f"Polling JSON parse error task {task_id}: {r.text[:180]}")
-                time.sleep(interval)
-                continue
-            qtasks = data.get('queued_tasks') or []
-            if not qtasks:
-                if self.poll_debug:
-                    print(f"[POLL {poll_count}] No queued_tasks array yet")
-                time.sleep(interval)
-                continue
-            task = qtasks[0]
-            last_status = task.get('status')
-            response_code = task.get('response_code')
-            if self.poll_debug:
-                print(f"[POLL {poll_count}] task_status={last_status} response_code={response_code} message={task.get('message')} progress={task.get('progress')}")
-            if response_code == 'success':
-                # find trip object
-                for obj in task.get('associated_objects', []):
-                    if obj.get('type') == 'trip':
-                        trip = obj.get('trip') or {}
-                        trip_id = trip.get('id')
-                        if trip_id:
-                            print(f"Task {task_id} complete -> trip_id={trip_id} ({label})")
-                            return trip_id
-                print(f"Task {task_id} success but no trip found yet; continuing...")
-            elif response_code == 'duplicate':
-                print(f"Task {task_id} marked duplicate; skipping upload for {label}.")
-                return DUPLICATE_TRIP
-            elif response_code in ('error', 'failed'):
-                print(f"Task {task_id} failed: {task.get('message')}")
-                return None
-            else:
-                # Still processing
-                pass
-            time.sleep(interval)
-        print(f"Timed out waiting for task {task_id} (last status={last_status})")
-        return None
+        """Wait for a queued task's trip ID; status polls are shared by all in-flight uploads."""
+        if self.dry_run:
+            log(f"[DRY-RUN] Would poll {self.base_url}/queued_tasks/status.json?ids={task_id}")
+            return -1
+        return self.task_poller.wait_for_trip(task_id, interval, timeout, label)
 
     def upload_photo(self, trip_id: int, photo_path: Path) -> bool:
         """Upload a single photo to a trip.
@@ -265,7 +464,7 @@ class RWGPSClient:
         Returns True on (200/201/202), else False.
         """
         if not photo_path.exists():
-            print(f"Photo missing, skipping: {photo_path}")
+            log(f"Photo missing, skipping: {photo_path}")
             return False
         self.ensure_auth()
         url = f"{self.base_url}/photos.json"
@@ -278,128 +477,236 @@ class RWGPSClient:
             "apikey": self.api_key,
             "auth_token": self.auth_token,
         }
-        mime = _guess_mime(photo_path)
-        files = {"file": (photo_path.name, open(photo_path, 'rb'), mime)}
-        data = {"parent_type": "trip", "parent_id": str(trip_id)}
         if self.dry_run:
-            print(f"[DRY-RUN] Would POST {url} photo={photo_path.name} -> trip {trip_id}")
+            log(f"[DRY-RUN] Would POST {url} photo={photo_path.name} -> trip {trip_id}")
             return True
+        mime = _guess_mime(photo_path)
+        fh = open(photo_path, 'rb')
         try:
-            r = requests.post(url, headers=headers, params=params, data=data, files=files, timeout=120)
+            encoder = MultipartEncoder(fields={
+                "file": (photo_path.name, fh, mime),
+                "parent_type": "trip",
+                "parent_id": str(trip_id),
+            })
+            headers["Content-Type"] = encoder.content_type
+            r = self.session.post(url, headers=headers, params=params, data=encoder, timeout=120)
         finally:
-            fh = files["file"][1]
             try:
                 fh.close()
             except Exception:
                 pass
         if r.status_code not in (200, 201, 202):
             snippet = r.text[:200].replace('\n', ' ')
-            print(f"Photo upload failed ({r.status_code}) {photo_path.name}: {snippet}")
+            log(f"Photo upload failed ({r.status_code}) {photo_path.name}: {snippet}")
             return False
-        print(f"Uploaded photo {photo_path.name} -> trip {trip_id}")
+        log(f"Uploaded photo {photo_path.name} -> trip {trip_id}")
         return True
 
     def upload_media_for_trip(self, trip_id: int, media_files: Iterable[Path]):
         media_list = list(media_files)
         if not media_list:
             return
-        print(f"Uploading {len(media_list)} photos for trip {trip_id}...")
+        log(f"Uploading {len(media_list)} photos for trip {trip_id}...")
         success = 0
-        for m in media_list:
-            try:
-                if self.upload_photo(trip_id, m):
-                    success += 1
-            except Exception as e:
-                print(f"Error uploading photo {m}: {e}")
-        print(f"Photos uploaded: {success}/{len(media_list)}")
+        with ThreadPoolExecutor(max_workers=min(self.photo_workers, len(media_list))) as ex:
+            futures = {ex.submit(self.upload_photo, trip_id, m): m for m in media_list}
+            for future in as_completed(futures):
+                try:
+                    if future.result():
+                        success += 1
+                except Exception as e:
+                    log(f"Error uploading photo {futures[future]}: {e}")
+        log(f"Photos uploaded: {success}/{len(media_list)}")
 
 
 # ---------- CSV Parsing ----------
-def load_activity_metadata(csv_path: Path, media_base: Path) -> Dict[str, ActivityMeta]:
+def load_activity_metadata(csv_path: Path, media_base: Path,
+                           activity_types: Optional[Iterable[str]] = DEFAULT_ACTIVITY_TYPES,
+                           cache_path: Optional[Path] = METADATA_CACHE) -> ActivityIndex:
+    """Return the CSV metadata lookup, reusing the cached copy when the CSV is unchanged.
+
+    The parsed index is pickled to `cache_path` together with the CSV's
+    mtime and size and the activity type filter; any mismatch (or an
+    unreadable cache) triggers a re-parse. Pass cache_path=None to always parse.
+    """
+    if not csv_path.exists():
+        raise FileNotFoundError(csv_path)
+    if activity_types is not None:
+        activity_types = tuple(sorted({t.strip().casefold() for t in activity_types}))
+    st = csv_path.stat()
+    key = (METADATA_CACHE_VERSION, str(csv_path.resolve()), str(media_base), activity_types,
+           st.st_mtime_ns, st.st_size)
+    if cache_path is not None:
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, cached_index = pickle.load(f)
+            if cached_key == key:
+                return cached_index
+        except Exception:
+            # Missing, corrupt or written by another version/entry point: re-parse.
+            pass
+    index = parse_activity_csv(csv_path, media_base, activity_types)
+    if cache_path is not None:
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((key, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            log(f"Could not write metadata cache {cache_path.name}: {e}")
+    return index
+
+
+def parse_activity_csv(csv_path: Path, media_base: Path,
+                       activity_types: Optional[Iterable[str]] = None) -> ActivityIndex:
     """Build a lookup of metadata by both Activity ID and file-based ID.
 
     The CSV 'Filename' column may contain compressed extensions (e.g. .fit.gz)
-    while actual files on disk are uncompressed (.fit). We index both the
-    Activity ID and the stripped filename stem (without extensions) so the
+    while actual files on disk are uncompressed (.fit). We index the Activity
+    ID and alias the stripped filename stem (without extensions) to it so the
     script can match either form.
+
+    When `activity_types` is given, only rows whose 'Activity Type' is one of
+    them (compared case-insensitively) are indexed (exports without that column are not filtered).
     """
-    if not csv_path.exists():
-        raise FileNotFoundError(csv_path)
-    mapping: Dict[str, ActivityMeta] = {}
-    with open(csv_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            act_id = (row.get('Activity ID') or '').strip()
-            if not act_id:
-                continue
-            name = (row.get('Activity Name') or '').strip()
-            description = (row.get('Activity Description') or '').strip()
-            media_field = (row.get('Media') or '').strip()
-            media_paths: List[Path] = []
-            if media_field:
-                for part in media_field.split('|'):
-                    p = media_base / part
-                    media_paths.append(p)
-
-            meta = ActivityMeta(
-                activity_id=act_id,
-                name=name or f"Activity {act_id}",
-                description=description,
-                media_paths=media_paths,
-            )
-            # Index by activity id
-            mapping.setdefault(act_id, meta)
-            # Index by filename-derived id
-            filename = (row.get('Filename') or '').strip()
+    # Imported here so runs served from the metadata cache skip pandas' import cost.
+    import pandas as pd
+
+    try:
+        df = pd.read_csv(csv_path, usecols=lambda c: c in CSV_COLUMNS or c == ACTIVITY_TYPE_COLUMN,
+                         dtype=str, na_filter=False, encoding='utf-8')
+    except pd.errors.EmptyDataError:
+        return ActivityIndex()  # zero-byte CSV: no rows, as csv.DictReader gave
+    df = df.reindex(columns=list(CSV_COLUMNS) + [ACTIVITY_TYPE_COLUMN], fill_value='')
+    for col in CSV_COLUMNS:
+        df[col] = df[col].str.strip()
+
+    index = ActivityIndex()
+    if activity_types is not None and (df[ACTIVITY_TYPE_COLUMN] != '').any():
+        wanted = {t.strip().casefold() for t in activity_types}
+        keep = df[ACTIVITY_TYPE_COLUMN].str.strip().str.casefold().isin(wanted)
+        # Remember what was dropped so callers can say why a file has no metadata
+        for act_id, filename in df.loc[~keep, ['Activity ID', 'Filename']].itertuples(index=False, name=None):
+            if act_id:
+                index.filtered.add(act_id)
             if filename:
-                # Extract base name (remove directories)
-                base = Path(filename).name
-                # Remove up to two extensions (.fit.gz -> base id)
-                for ext in ('.fit.gz', '.gpx.gz', '.tcx.gz', '.fit', '.gpx', '.tcx'):
-                    if base.endswith(ext):
-                        file_id = base[:-len(ext)]
-                        if file_id:
-                            mapping.setdefault(file_id, meta)
-                        break
-    return mapping
+                index.filtered.add(_EXT_RE.sub('', Path(filename).name))
+        df = df[keep]
+    df = df[list(CSV_COLUMNS)]
+    for act_id, name, description, media_field, filename in df.itertuples(index=False, name=None):
+        if not act_id:
+            continue
+        media_paths: List[Path] = []
+        if media_field:
+            for part in media_field.split('|'):
+                p = media_base / part
+                media_paths.append(p)
+
+        meta = ActivityMeta(
+            activity_id=act_id,
+            name=name or f"Activity {act_id}",
+            description=description,
+            media_paths=media_paths,
+        )
+        # Index by activity id
+        index.by_id.setdefault(act_id, meta)
+        # Alias the filename-derived id
+        if filename:
+            # Extract base name (remove directories)
+            base = Path(filename).name
+            # Remove up to two extensions (.fit.gz -> base id)
+            file_id = _EXT_RE.sub('', base)
+            if file_id and file_id != base and file_id != act_id:
+                index.aliases.setdefault(file_id, act_id)
+    return index
 
 
 def load_uploaded_set() -> set[str]:
     if not UPLOADED_LOG.exists():
         return set()
-    return {line.strip() for line in UPLOADED_LOG.read_text().splitlines() if line.strip()}
+    with open(UPLOADED_LOG, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return set()  # mmap cannot map an empty file
+        # Walk the mapped lines rather than decoding the whole log into one string
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return {line.strip().decode('utf-8') for line in iter(mm.readline, b'') if line.strip()}
+
+
+class UploadedLog:
+    """Append handle for the uploaded log, kept open for the whole run.
+
+    The file is opened on the first add (so dry runs never create it) and
+    flushed every `flush_every` IDs and on close.
+    """
+
+    def __init__(self, path: Path = UPLOADED_LOG, flush_every: int = 10):
+        self.path = path
+        self.flush_every = flush_every
+        self._fh = None
+        self._unflushed = 0
 
+    def add(self, activity_id: str):
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+        self._fh.write(activity_id + '\n')
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self._fh.flush()
+            self._unflushed = 0
 
-def append_uploaded(activity_id: str):
-    with open(UPLOADED_LOG, 'a', encoding='utf-8') as f:
-        f.write(activity_id + '\n')
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self) -> "UploadedLog":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 # ---------- Main Logic ----------
 def infer_activity_id_from_filename(filename: str) -> str:
-    base = filename
-    # Strip double extensions like .fit.gz or .gpx.gz
-    for ext in ('.fit.gz', '.gpx.gz', '.tcx.gz'):
-        if base.endswith(ext):
-            return base[:-len(ext)]
-    for ext in ('.fit', '.gpx', '.tcx'):
-        if base.endswith(ext):
-            return base[:-len(ext)]
-    return base
+    # Strip single or double extensions like .fit, .fit.gz or .gpx.gz
+    return _EXT_RE.sub('', filename) or filename
 
 
 def discover_activity_files(directory: Path) -> List[Path]:
     exts = {'.fit', '.gpx', '.tcx', '.gz'}
     files = []
     if not directory.exists():
-        print(f"Directory missing: {directory}")
+        log(f"Directory missing: {directory}")
         return files
-    for p in sorted(directory.iterdir()):
-        if p.is_file() and (p.suffix in exts or any(str(p.name).endswith(suf) for suf in ('.fit.gz', '.gpx.gz', '.tcx.gz'))):
-            files.append(p)
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        name = entry.name
+        if entry.is_file() and (os.path.splitext(name)[1] in exts or name.endswith(('.fit.gz', '.gpx.gz', '.tcx.gz'))):
+            files.append(Path(entry.path))
     return files
 
 
+def upload_activity(client: RWGPSClient, fpath: Path, meta: ActivityMeta,
+                    poll_interval: float, poll_timeout: float) -> Optional[int]:
+    """Upload one activity file and, once its trip exists, the trip photos.
+
+    Runs on a worker thread; returns the trip ID (or DUPLICATE_TRIP/None)
+    so the caller can tally results and update the uploaded log.
+    """
+    trip_id = client.upload_trip_from_file(
+        fpath,
+        meta.name,
+        meta.description,
+        poll=True,
+        poll_interval=poll_interval,
+        poll_timeout=poll_timeout,
+    )
+    if trip_id is not None and trip_id != DUPLICATE_TRIP:
+        client.upload_media_for_trip(trip_id, [p for p in meta.media_paths if p.exists()])
+    return trip_id
+
+
 def parse_bool(val: Optional[str], default: bool = False) -> bool:
     if val is None:
         return default
@@ -411,12 +718,20 @@ def main():
     parser = argparse.ArgumentParser(description="Upload cycling activities to RideWithGPS")
     parser.add_argument('--dry-run', action='store_true', help='Do not perform network mutations.')
     parser.add_argument('--only', help='Comma-separated list of activity IDs to restrict uploads.')
+    parser.add_argument('--activity-type',
+                        help='Comma-separated Strava Activity Type values to load from the CSV, '
+                             'case-insensitive, or "all" (default: '
+                             + ', '.join(DEFAULT_ACTIVITY_TYPES) + ').')
     parser.add_argument('--force', action='store_true', help='Re-upload even if already logged as uploaded.')
     parser.add_argument('--poll-interval', type=float, default=float(os.getenv('RWGPS_TASK_POLL_INTERVAL', '2.0')),
-                        help='Seconds between queued task polls (default env RWGPS_TASK_POLL_INTERVAL or 2.0).')
+                        help='Max seconds between queued task polls; polling backs off up to this '
+                             '(default env RWGPS_TASK_POLL_INTERVAL or 2.0).')
     parser.add_argument('--poll-timeout', type=float, default=float(os.getenv('RWGPS_TASK_POLL_TIMEOUT', '300')),
                         help='Max seconds to wait for queued task (default env RWGPS_TASK_POLL_TIMEOUT or 300).')
     parser.add_argument('--poll-debug', action='store_true', help='Verbose debug output for queued task polling.')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('RWGPS_CONCURRENCY', '4')),
+                        help='Number of activities to upload in parallel (default env RWGPS_CONCURRENCY or 4). '
+                             f'Each uploads up to {PHOTO_CONCURRENCY} of its photos at a time.')
     args = parser.parse_args()
 
     dry_env = parse_bool(os.getenv('RWGPS_DRY_RUN')) or False
@@ -431,74 +746,120 @@ def main():
     base_url = os.getenv('RWGPS_BASE_URL', 'https://ridewithgps.com')
 
     if not api_key:
-        print('ERROR: RWGPS_API_KEY must be set (env or .env file).')
+        log('ERROR: RWGPS_API_KEY must be set (env or .env file).')
         return 2
 
     client = RWGPSClient(api_key=api_key, base_url=base_url, version=version, auth_token=auth_token,
                          email=email, password=password, dry_run=dry_run, photo_version=photo_version,
-                         poll_debug=args.poll_debug)
+                         poll_debug=args.poll_debug, max_workers=args.concurrency)
+
+    activity_types = DEFAULT_ACTIVITY_TYPES
+    if args.activity_type:
+        if args.activity_type.strip().lower() == 'all':
+            activity_types = None
+        else:
+            activity_types = tuple(x.strip() for x in args.activity_type.split(',') if x.strip())
 
-    activity_meta = load_activity_metadata(CSV_PATH, PROJECT_ROOT)
-    print(f"Loaded metadata for {len(activity_meta)} activities from CSV.")
+    activity_meta = load_activity_metadata(CSV_PATH, PROJECT_ROOT, activity_types)
+    log(f"Loaded metadata for {len(activity_meta)} activities from CSV.")
 
     target_ids = None
     if args.only:
         target_ids = {x.strip() for x in args.only.split(',') if x.strip()}
-        print(f"Restricting to {len(target_ids)} specified activities.")
+        log(f"Restricting to {len(target_ids)} specified activities.")
 
     already_uploaded = load_uploaded_set()
-    print(f"Already uploaded: {len(already_uploaded)}")
+    log(f"Already uploaded: {len(already_uploaded)}")
 
     files = discover_activity_files(CYCLING_DIR)
     if not files:
-        print("No activity files found to process.")
+        log("No activity files found to process.")
         return 0
-    print(f"Found {len(files)} potential files in {CYCLING_DIR}.")
+    log(f"Found {len(files)} potential files in {CYCLING_DIR}.")
 
     successes = 0
     skipped = 0
     errors = 0
+    queued = []
     for fpath in files:
         act_id = infer_activity_id_from_filename(fpath.name)
         if target_ids and act_id not in target_ids:
             continue
         if (not args.force) and (act_id in already_uploaded):
-            print(f"Skip {fpath.name} (already uploaded)")
+            log(f"Skip {fpath.name} (already uploaded)")
             skipped += 1
             continue
         meta = activity_meta.get(act_id)
-        if not meta:
-            print(f"No CSV metadata for {act_id}, skipping file {fpath.name}")
+        if not meta and act_id in activity_meta.filtered:
+            log(f"Skip {fpath.name} (Activity Type filtered by --activity-type)")
             skipped += 1
             continue
-        try:
-            trip_id = client.upload_trip_from_file(
-                fpath,
-                meta.name,
-                meta.description,
-                poll=True,
-                poll_interval=args.poll_interval,
-                poll_timeout=args.poll_timeout,
-            )
-        except Exception as e:
-            print(f"Error uploading {fpath.name}: {e}")
-            errors += 1
-            continue
-        if trip_id == DUPLICATE_TRIP:
-            print(f"Duplicate detected for {fpath.name}; skipping media upload.")
-            # Consider the activity handled to avoid future attempts
-            if not dry_run:
-                append_uploaded(act_id)
+        if not meta:
+            log(f"No CSV metadata for {act_id}, skipping file {fpath.name}")
             skipped += 1
-        elif trip_id is not None:
-            client.upload_media_for_trip(trip_id, [p for p in meta.media_paths if p.exists()])
-            if not dry_run and trip_id != -1:
-                append_uploaded(act_id)
-            successes += 1
-        else:
-            errors += 1
+            continue
+        queued.append((fpath, act_id, meta))
+
+    # Uploads and their polling waits overlap on worker threads; results are
+    # handled here so the uploaded log is only written from the main thread.
+    with UploadedLog() as uploaded_log, ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as ex:
+        futures = {
+            ex.submit(upload_activity, client, fpath, meta, args.poll_interval, args.poll_timeout): (fpath, act_id)
+            for fpath, act_id, meta in queued
+        }
 
-    print("""\nSummary:
+        recorded = set()
+
+        def record(future) -> str:
+            """Log the outcome of one finished upload; returns 'success', 'skipped' or 'error'."""
+            recorded.add(future)
+            fpath, act_id = futures[future]
+            try:
+                trip_id = future.result()
+            except Exception as e:
+                log(f"Error uploading {fpath.name}: {e}")
+                return 'error'
+            if trip_id == DUPLICATE_TRIP:
+                log(f"Duplicate detected for {fpath.name}; skipping media upload.")
+                # Consider the activity handled to avoid future attempts
+                if not dry_run:
+                    uploaded_log.add(act_id)
+                return 'skipped'
+            if trip_id is not None:
+                if not dry_run and trip_id != -1:
+                    uploaded_log.add(act_id)
+                return 'success'
+            return 'error'
+
+        try:
+            for future in as_completed(futures):
+                outcome = record(future)
+                if outcome == 'success':
+                    successes += 1
+                elif outcome == 'skipped':
+                    skipped += 1
+                else:
+                    errors += 1
+        except BaseException:
+            # Stop queued uploads, but still record the ones already started so
+            # the next run doesn't re-upload trips that now exist.
+            ex.shutdown(wait=False, cancel_futures=True)
+            started = {f for f in futures if f not in recorded and not f.cancelled()}
+            log(f"Interrupted: cancelled queued uploads; waiting for {len(started)} in progress...")
+            # Worker threads are joined at exit regardless, so further interrupts
+            # don't end the run sooner; keep recording until every upload is in.
+            while started:
+                try:
+                    for future in as_completed(started):
+                        record(future)
+                        started.discard(future)
+                except KeyboardInterrupt:
+                    for future in [f for f in started if f.done()]:
+                        record(future)
+                        started.discard(future)
+            raise
+
+    log("""\nSummary:
   Successes: {s}
   Skipped: {sk}
   Errors: {er}""".format(s=successes, sk=skipped, er=errors))